@@ -10,6 +10,7 @@
 #               In '2-color' mode, partial refresh is available
 #               Set whether content in red buffer is displayed in black by calling CombineRB()
 #               To enable partial refresh, call RefreshMode('partial')
+#               On RP2040, pass the SPI block number as SPI_ID to send frames by DMA
 # Disclaimer  : Partial refresh is not officially supported by the display OEM, may cause irreversible damage to the display
 #               Use this code at your own risk
 # Known issues: ·Ensuring no red is on the display in '2-color' mode is not enforced in code, this duty falls on the user
@@ -21,42 +22,278 @@
 
 from machine import Pin, SPI
 import framebuf
+import micropython
+from micropython import const
+import sys
 import utime
+try:
+    from machine import mem32
+except ImportError:
+    mem32 = None
+try:
+    from rp2 import DMA
+except ImportError:
+    DMA = None
+try:
+    from binascii import crc32
+except ImportError:
+    crc32 = None
+
+
+# panel geometry, const() inlines these into the bytecode and the viper kernels
+_X_RES = const(152)
+_Y_RES = const(296)
+_X_BYTE = const(_X_RES // 8)
+_Y_BIT = const(_Y_RES)
+_FRAME_SIZE = const(_X_BYTE * _Y_BIT)    # bytes per image, 5624
+
+
+# register addresses below are RP2040 only (the RP2350 maps its peripherals differently), accessed through machine.mem32
+_RP2040 = mem32 is not None and 'RP2040' in getattr(sys.implementation, '_machine', '')
+
+# RP2040 PL022 SPI registers and TX DREQs, used to feed the SPI with DMA
+_SPI_BASE = (0x4003C000, 0x40040000)
+_SPI_TX_DREQ = (16, 18)
+_SSPDR = const(0x08)
+_SSPSR = const(0x0C)
+_SSPSR_BSY = const(0x10)
+
+# RP2040 SIO register, clears several GPIO outputs in one write
+_SIO_GPIO_OUT_CLR = 0xD0000018
+
+
+# GPIO bit of a machine.Pin on RP2040, 0 if it can't be determined
+# Pin(n) without arguments returns the existing pin object, so it can be matched by identity
+def _gpio_mask(pin):
+    if _RP2040:
+        for n in range(30):
+            if Pin(n) is pin:
+                return 1 << n
+    return 0
+
+
+def _reverse_byte(v):
+    v = (v & 0x0f) << 4 | (v & 0xf0) >> 4
+    v = (v & 0x33) << 2 | (v & 0xcc) >> 2
+    return (v & 0x55) << 1 | (v & 0xaa) >> 1
+
+
+# bit-reversed value of every byte, looked up when sending flipped orientations
+# built once at import and shared by all displays
+_REV_LUT = bytes(_reverse_byte(i) for i in range(256))
+
+
+# frame reshuffle kernels, copy the framebuffer into the display's RAM order
+# invert is XOR-ed into every byte, 0x00 for black and 0xFF for red
+# portrait is a straight copy, done a 32-bit word at a time
+# the frame is 5624 = 1406 * 4 bytes and bytearray storage is word aligned
+@micropython.viper
+def _reshuf_portrait(src: ptr32, dst: ptr32, invert: int):
+    invert *= 0x01010101
+    for i in range(_FRAME_SIZE >> 2):
+        dst[i] = src[i] ^ invert
+
+
+@micropython.viper
+def _reshuf_portrait_flipped(src: ptr8, dst: ptr8, invert: int):
+    rev_lut = ptr8(_REV_LUT)
+    for i in range(_FRAME_SIZE):
+        dst[i] = rev_lut[src[_FRAME_SIZE - 1 - i]] ^ invert
+
+
+# landscape orientations transpose the image, every RAM x byte is one row of framebuffer bytes
+# walked with a running source index, no per-byte multiply
+@micropython.viper
+def _reshuf_landscape(src: ptr8, dst: ptr8, invert: int):
+    k = 0
+    for j in range(_X_BYTE):
+        s = (_X_BYTE - j - 1) * _Y_BIT
+        for i in range(_Y_BIT):
+            dst[k] = src[s] ^ invert
+            k += 1
+            s += 1
+
+
+@micropython.viper
+def _reshuf_landscape_flipped(src: ptr8, dst: ptr8, invert: int):
+    rev_lut = ptr8(_REV_LUT)
+    k = 0
+    for j in range(_X_BYTE):
+        s = (j + 1) * _Y_BIT - 1
+        for i in range(_Y_BIT):
+            dst[k] = rev_lut[src[s]] ^ invert
+            k += 1
+            s -= 1
+
+
+# copy a window of the image in RAM order for a partial write, returns the number of bytes
+# g = [first source byte, outer stride, inner stride, outer count, inner count, bit reversed]
+# the inner loop runs along the address the data entry mode increments first
+# black and red are ANDed, pass the black image twice when CombineRB() is off
+@micropython.viper
+def _gather(black: ptr8, red: ptr8, dst: ptr8, g) -> int:
+    s = int(g[0])
+    so = int(g[1])
+    si = int(g[2])
+    no = int(g[3])
+    ni = int(g[4])
+    rev = int(g[5])
+    rev_lut = ptr8(_REV_LUT)
+    k = 0
+    for o in range(no):
+        i = s
+        for n in range(ni):
+            v = black[i] & red[i]
+            if rev:
+                v = rev_lut[v]
+            dst[k] = v
+            k += 1
+            i += si
+        s += so
+    return k
+
+
+# all-zero frame, written a 32-bit word at a time
+@micropython.viper
+def _clear(dst: ptr32):
+    for i in range(_FRAME_SIZE >> 2):
+        dst[i] = 0
+
+
+# CombineRB() kernels, same orders as above with the black and red images ANDed together
+# the red image starts _FRAME_SIZE bytes into the shared buffer, so it is word aligned as well
+@micropython.viper
+def _combine_portrait(black: ptr32, red: ptr32, dst: ptr32):
+    for i in range(_FRAME_SIZE >> 2):
+        dst[i] = black[i] & red[i]
+
+
+@micropython.viper
+def _combine_portrait_flipped(black: ptr8, red: ptr8, dst: ptr8):
+    rev_lut = ptr8(_REV_LUT)
+    for i in range(_FRAME_SIZE):
+        dst[i] = rev_lut[black[_FRAME_SIZE - 1 - i] & red[_FRAME_SIZE - 1 - i]]
+
+
+@micropython.viper
+def _combine_landscape(black: ptr8, red: ptr8, dst: ptr8):
+    k = 0
+    for j in range(_X_BYTE):
+        s = (_X_BYTE - j - 1) * _Y_BIT
+        for i in range(_Y_BIT):
+            dst[k] = black[s] & red[s]
+            k += 1
+            s += 1
+
+
+@micropython.viper
+def _combine_landscape_flipped(black: ptr8, red: ptr8, dst: ptr8):
+    rev_lut = ptr8(_REV_LUT)
+    k = 0
+    for j in range(_X_BYTE):
+        s = (j + 1) * _Y_BIT - 1
+        for i in range(_Y_BIT):
+            dst[k] = rev_lut[black[s] & red[s]]
+            k += 1
+            s -= 1
+
+
+# (reshuffle, CombineRB()) kernels of every orientation, picked once by __init__()
+_KERNELS = {'portrait': (_reshuf_portrait, _combine_portrait),
+            'portrait_flipped': (_reshuf_portrait_flipped, _combine_portrait_flipped),
+            'landscape': (_reshuf_landscape, _combine_landscape),
+            'landscape_flipped': (_reshuf_landscape_flipped, _combine_landscape_flipped)}
+
+# map the dirty box d = [x0, y0, x1, y1] to the RAM window w = [xb0, xb1, ya, yb] (x bytes and rows, inclusive)
+# and store where the window starts in the framebuffer and the loop counts into the _gather() parameters g
+def _window_portrait(d, w, g):
+    xb0 = d[0] >> 3
+    xb1 = (d[2] - 1) >> 3
+    ya = d[1]
+    yb = d[3] - 1
+    w[0] = xb0
+    w[1] = xb1
+    w[2] = ya
+    w[3] = yb
+    g[0] = ya * _X_BYTE + xb0
+    g[3] = yb - ya + 1
+    g[4] = xb1 - xb0 + 1
+
+
+def _window_portrait_flipped(d, w, g):
+    xb0 = _X_BYTE - 1 - ((d[2] - 1) >> 3)
+    xb1 = _X_BYTE - 1 - (d[0] >> 3)
+    ya = _Y_RES - d[3]
+    yb = _Y_RES - 1 - d[1]
+    w[0] = xb0
+    w[1] = xb1
+    w[2] = ya
+    w[3] = yb
+    g[0] = _FRAME_SIZE - 1 - ya * _X_BYTE - xb0
+    g[3] = yb - ya + 1
+    g[4] = xb1 - xb0 + 1
+
+
+def _window_landscape(d, w, g):
+    xb0 = _X_BYTE - 1 - ((d[3] - 1) >> 3)
+    xb1 = _X_BYTE - 1 - (d[1] >> 3)
+    ya = d[0]
+    yb = d[2] - 1
+    w[0] = xb0
+    w[1] = xb1
+    w[2] = ya
+    w[3] = yb
+    g[0] = (_X_BYTE - 1 - xb0) * _Y_BIT + ya
+    g[3] = xb1 - xb0 + 1
+    g[4] = yb - ya + 1
+
+
+def _window_landscape_flipped(d, w, g):
+    xb0 = d[1] >> 3
+    xb1 = (d[3] - 1) >> 3
+    ya = _Y_RES - d[2]
+    yb = _Y_RES - 1 - d[0]
+    w[0] = xb0
+    w[1] = xb1
+    w[2] = ya
+    w[3] = yb
+    g[0] = xb0 * _Y_BIT + _Y_BIT - 1 - ya
+    g[3] = xb1 - xb0 + 1
+    g[4] = yb - ya + 1
+
+
+# (window mapping, _gather() outer stride, inner stride, bit reversed) of every orientation, picked once by __init__()
+_WINDOWS = {'portrait': (_window_portrait, _X_BYTE, 1, 0),
+            'portrait_flipped': (_window_portrait_flipped, -_X_BYTE, -1, 1),
+            'landscape': (_window_landscape, -_Y_BIT, 1, 0),
+            'landscape_flipped': (_window_landscape_flipped, _Y_BIT, -1, 1)}
 
 
 class EPD_2in66_B:
-    _x_res = 152
-    _y_res = 296
-    _x_byte = _x_res // 8
-    _y_bit = _y_res
-    _lut = [0x00,0x40,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
-            0x00,0x00,0x80,0x80,0x00,0x00,0x00,0x00,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x40,0x40,0x00,0x00,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x80,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
-            0x0A,0x00,0x00,0x00,0x00,0x00,0x02,0x01,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x01,0x00,0x00,0x00,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
-            0x00,0x00,0x00,0x00,0x22,0x22,0x22,0x22,0x22,0x22,
-            0x00,0x00,0x00,0x22,0x17,0x41,0xB0,0x32,0x36]
+    # waveform written to register 0x32 for partial refresh, which takes exactly 153 bytes
+    # the 6 trailing voltage bytes of the vendor table (0x22,0x17,0x41,0xB0,0x32,0x36) were never sent, so they are not stored
+    _lut = bytes((0x00,0x40,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
+                  0x00,0x00,0x80,0x80,0x00,0x00,0x00,0x00,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x40,0x40,0x00,0x00,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x80,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
+                  0x0A,0x00,0x00,0x00,0x00,0x00,0x02,0x01,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x01,0x00,0x00,0x00,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
+                  0x00,0x00,0x00,0x00,0x22,0x22,0x22,0x22,0x22,0x22,
+                  0x00,0x00,0x00))
     
     @staticmethod
     def __Delayms(delaytime):
         utime.sleep_ms(delaytime)
     
-    @staticmethod
-    def __ReverseByte(v):
-        v = (v & 0x0f) << 4 | (v & 0xf0) >> 4
-        v = (v & 0x33) << 2 | (v & 0xcc) >> 2
-        return (v & 0x55) << 1 | (v & 0xaa) >> 1
-    
-    def __init__(self, RST, DC, CS, BUSY, EPD_SPI, ORIENTATION = 'portrait', COLORMODE = '3-color', REFRESHMODE = 'global'):
+    def __init__(self, RST, DC, CS, BUSY, EPD_SPI, ORIENTATION = 'portrait', COLORMODE = '3-color', REFRESHMODE = 'global', SPI_ID = None):
         self._reset_pin = RST
         self._dc_pin = DC
         self._cs_pin = CS
@@ -64,21 +301,66 @@ class EPD_2in66_B:
         self._spi = EPD_SPI
         self._orientation = ORIENTATION
         if (ORIENTATION == 'portrait' or ORIENTATION == 'portrait_flipped'):
-            self._width = self._x_res
-            self._height = self._y_res
-            self._black_buffer_array = bytearray(self._height * self._width // 8)
-            self._red_buffer_array = bytearray(self._height * self._width // 8)
-            self.black_buffer = framebuf.FrameBuffer(self._black_buffer_array, self._width, self._height, framebuf.MONO_HLSB)
-            self.red_buffer = framebuf.FrameBuffer(self._red_buffer_array, self._width, self._height, framebuf.MONO_HLSB)
+            self._width = _X_RES
+            self._height = _Y_RES
+            buffer_format = framebuf.MONO_HLSB
         elif (ORIENTATION == 'landscape' or ORIENTATION == 'landscape_flipped'):
-            self._width = self._y_res
-            self._height = self._x_res
-            self._black_buffer_array = bytearray(self._height * self._width // 8)
-            self._red_buffer_array = bytearray(self._height * self._width // 8)
-            self.black_buffer = framebuf.FrameBuffer(self._black_buffer_array, self._width, self._height, framebuf.MONO_VLSB)
-            self.red_buffer = framebuf.FrameBuffer(self._red_buffer_array, self._width, self._height, framebuf.MONO_VLSB)
+            self._width = _Y_RES
+            self._height = _X_RES
+            buffer_format = framebuf.MONO_VLSB
         else:
             raise ValueError('\'ORIENTATION\' in __init__()')
+        # black and red images share one allocation, less heap fragmentation than two separate buffers
+        buffer_size = self._height * self._width // 8
+        self._buffer_array = bytearray(2 * buffer_size)
+        self._black_buffer_array = memoryview(self._buffer_array)[0:buffer_size]
+        self._red_buffer_array = memoryview(self._buffer_array)[buffer_size:]
+        self.black_buffer = framebuf.FrameBuffer(self._black_buffer_array, self._width, self._height, buffer_format)
+        self.red_buffer = framebuf.FrameBuffer(self._red_buffer_array, self._width, self._height, buffer_format)
+        self._tx_buf = bytearray(_FRAME_SIZE)   # reused for every frame, no allocation per Draw()
+        self._tx_mv = memoryview(self._tx_buf)
+        self._reshuf, self._combine = _KERNELS[ORIENTATION]
+        self._tx_direct = ORIENTATION == 'portrait'   # the black framebuffer is already in RAM order
+        # window writes reuse these, no allocation per Draw()
+        self._window, so, si, rev = _WINDOWS[ORIENTATION]
+        self._gather_g = [0, so, si, 0, 0, rev]
+        self._win = [0, 0, 0, 0]
+        self._dirty_box = [0, 0, 0, 0]
+        self._par = bytearray(4)    # window/cursor parameters, sent through the fixed length views below
+        par_mv = memoryview(self._par)
+        self._par1 = par_mv[0:1]
+        self._par2 = par_mv[0:2]
+        self._par4 = par_mv
+        self._tx_win = None # view of the first _tx_win_len bytes of _tx_mv, kept while the window size repeats
+        self._tx_win_len = 0
+        self._byte_buf = bytearray(1)   # scratch for single command/data bytes
+        # on RP2040, select the controller for a command by clearing DC and CS with one register write
+        dc_mask = _gpio_mask(DC)
+        cs_mask = _gpio_mask(CS)
+        self._sio = dc_mask != 0 and cs_mask != 0
+        self._dc_cs_mask = dc_mask | cs_mask
+        # on RP2040, passing the SPI block number lets frames stream out by DMA while the CPU keeps working
+        self._dma = None
+        self._dma_pending = False
+        self._dma_src = None
+        if SPI_ID is not None:
+            if SPI_ID not in (0, 1):
+                raise ValueError('\'SPI_ID\' in __init__()')
+            if (DMA is not None and _RP2040):
+                self._dma = DMA()
+                self._dma_ctrl = self._dma.pack_ctrl(size = 0, inc_write = False, treq_sel = _SPI_TX_DREQ[SPI_ID])
+                self._spi_dr = _SPI_BASE[SPI_ID] + _SSPDR
+                self._spi_sr = _SPI_BASE[SPI_ID] + _SSPSR
+        # with DMA the red image gets its own transmit buffer, so it can be reshuffled while the black image is still sent
+        if self._dma is not None:
+            self._tx_red_mv = memoryview(bytearray(_FRAME_SIZE))
+        else:
+            self._tx_red_mv = self._tx_mv
+        self._rst_settled = False
+        self._initialized_for = None    # (color mode, refresh mode) the controller is currently set up for
+        self._ram_crc = [None, None]    # crc32 of the frames last written to RAM 0x24 / 0x26, None if unknown
+        self._ram_synced = False    # RAM 0x24 holds the whole current image, so a window of it can be updated
+        self._dirty = None  # [x0, y0, x1, y1] bounding box of the areas passed to MarkDirty() since the last Draw()
         self._color_mode = COLORMODE
         self.ColorMode(self._color_mode)
         self._refresh_mode = REFRESHMODE
@@ -87,110 +369,113 @@ class EPD_2in66_B:
         self._max_pr = 0
         self._pr = 0
         self._ar_enabled = False
+        self._refresh_pending = False
         self.black_buffer.fill(1)
         self.red_buffer.fill(1)
     
-    def __SendCommand(self, command):
-        self._dc_pin.low()
-        self._cs_pin.low()
-        self._spi.write(bytearray([command]))
+    # command byte followed by its parameters in one CS window, DC goes high between them
+    @micropython.native
+    def __Send(self, command, data = b''):
+        self.__WaitDMA()
+        self._byte_buf[0] = command
+        if self._sio:
+            mem32[_SIO_GPIO_OUT_CLR] = self._dc_cs_mask
+        else:
+            self._dc_pin.low()
+            self._cs_pin.low()
+        self._spi.write(self._byte_buf)
+        if data:
+            self._dc_pin.high()
+            self._spi.write(data)
         self._cs_pin.high()
     
-    def __SendData(self, data):
+    # send a whole buffer as data in a single SPI transaction
+    # with DMA this only starts the transfer, buf must not change until __WaitDMA() returns
+    def __SendDataBytes(self, buf):
+        self.__WaitDMA()
         self._dc_pin.high()
         self._cs_pin.low()
-        self._spi.write(bytearray([data]))
-        self._cs_pin.high()
+        if self._dma is None:
+            self._spi.write(buf)
+            self._cs_pin.high()
+        else:
+            self._dma.config(read = buf, write = self._spi_dr, count = len(buf), ctrl = self._dma_ctrl, trigger = True)
+            self._dma_src = buf
+            self._dma_pending = True
+    
+    # finish a transfer started by __SendDataBytes(), called before the bus or a transmit buffer is used again
+    def __WaitDMA(self):
+        if self._dma_pending:
+            active = self._dma.active
+            spi_sr = self._spi_sr
+            while active():
+                pass
+            while mem32[spi_sr] & _SSPSR_BSY:    # last byte still shifting out
+                pass
+            self._cs_pin.high()
+            self._dma_pending = False
     
     def __SendLUT(self):
-        self.__SendCommand(0x32)
-        for i in range(0, 153):
-            self.__SendData(self._lut[i])
+        self.__Send(0x32, self._lut)
         self.__ReadBusy()
     
-    def __SendBlack(self):
-        if (self._orientation == 'portrait'):
-            for i in range(0, self._x_byte * self._y_bit):
-                self.__SendData(self._black_buffer_array[i])
-        elif (self._orientation == 'portrait_flipped'):
-            for i in range(0, self._x_byte * self._y_bit):
-                self.__SendData(self.__ReverseByte(self._black_buffer_array[self._x_byte * self._y_bit - 1 - i]))
-        elif (self._orientation == 'landscape'):
-            for j in range(0, self._x_byte):
-                for i in range(0, self._y_bit):
-                    self.__SendData(self._black_buffer_array[i + (self._x_byte - j - 1) * self._y_bit])
-        else:
-            for j in range(0, self._x_byte):
-                for i in range(0, self._y_bit):
-                    self.__SendData(self.__ReverseByte(self._black_buffer_array[(j + 1) * self._y_bit - 1 - i]))
-    
-    def __SendRed(self):
-        if (self._orientation == 'portrait'):
-            for i in range(0, self._x_byte * self._y_bit):
-                self.__SendData(~self._red_buffer_array[i])
-        elif (self._orientation == 'portrait_flipped'):
-            for i in range(0, self._x_byte * self._y_bit):
-                self.__SendData(~self.__ReverseByte(self._red_buffer_array[self._x_byte * self._y_bit - 1 - i]))             
-        elif (self._orientation == 'landscape'):
-            for j in range(0, self._x_byte):
-                for i in range(0, self._y_bit):
-                    self.__SendData(~self._red_buffer_array[i + (self._x_byte - j - 1) * self._y_bit])
-        else:
-            for j in range(0, self._x_byte):
-                for i in range(0, self._y_bit):
-                    self.__SendData(~self.__ReverseByte(self._red_buffer_array[(j + 1) * self._y_bit - 1 - i]))
-    
-    def __SendRB(self):
-        if (self._orientation == 'portrait'):
-            for i in range(0, self._x_byte * self._y_bit):
-                self.__SendData(self._black_buffer_array[i] & self._red_buffer_array[i])
-        elif (self._orientation == 'portrait_flipped'):
-            for i in range(0, self._x_byte * self._y_bit):
-                self.__SendData(self.__ReverseByte(self._black_buffer_array[self._x_byte * self._y_bit - 1 - i] & self._red_buffer_array[self._x_byte * self._y_bit - 1 - i]))
-        elif (self._orientation == 'landscape'):
-            for j in range(0, self._x_byte):
-                for i in range(0, self._y_bit):
-                    self.__SendData(self._black_buffer_array[i + (self._x_byte - j - 1) * self._y_bit] & self._red_buffer_array[i + (self._x_byte - j - 1) * self._y_bit])
+    # reshuffle a framebuffer into the transmit buffer tx in the order the display expects
+    def __BuildTx(self, buf, invert, tx):
+        if (self._dma_pending and self._dma_src is tx):
+            self.__WaitDMA()    # tx is still being sent
+        self._reshuf(buf, tx, invert)
+        return tx
+    
+    # the builders return the buffer to send and touch no bus lines, so they can run while a DMA transfer is in flight
+    def __BuildBlack(self):
+        if self._tx_direct:
+            return self._black_buffer_array
         else:
-            for j in range(0, self._x_byte):
-                for i in range(0, self._y_bit):
-                    self.__SendData(self.__ReverseByte(self._black_buffer_array[(j + 1) * self._y_bit - 1 - i] & self._red_buffer_array[(j + 1) * self._y_bit - 1 - i]))
+            return self.__BuildTx(self._black_buffer_array, 0x00, self._tx_mv)
+    
+    def __BuildRB(self):
+        tx = self._tx_mv
+        if (self._dma_pending and self._dma_src is tx):
+            self.__WaitDMA()
+        self._combine(self._black_buffer_array, self._red_buffer_array, tx)
+        return tx
     
     def __ReadBusy(self):
-        while(self._busy_pin.value() == 1):
-            self.__Delayms(50)
+        busy = self._busy_pin.value
+        sleep_ms = utime.sleep_ms
+        while(busy() == 1):
+            sleep_ms(1)   # short poll, BUSY can drop long before a 50ms tick
     
+    @micropython.native
     def __SetWindow(self): # set the framebuffer's start & end address
-        self.__SendCommand(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
-        self.__SendData(0x00)
-        self.__SendData(0x12)
-        self.__SendCommand(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.__SendData(0x00)
-        self.__SendData(0x00)
-        self.__SendData(0x27)
-        self.__SendData(0x01)
+        self.__Send(0x44, b'\x00\x12') # SET_RAM_X_ADDRESS_START_END_POSITION
+        self.__Send(0x45, b'\x00\x00\x27\x01') # SET_RAM_Y_ADDRESS_START_END_POSITION
     
+    @micropython.native
     def __SetCursor(self):	# 
-        self.__SendCommand(0x4E) # SET_RAM_X_ADDRESS_COUNTER
-        self.__SendData(0x00)
-        self.__SendCommand(0x4F) # SET_RAM_Y_ADDRESS_COUNTER
-        self.__SendData(0x00)
-        self.__SendData(0x00)
+        self.__Send(0x4E, b'\x00') # SET_RAM_X_ADDRESS_COUNTER
+        self.__Send(0x4F, b'\x00\x00') # SET_RAM_Y_ADDRESS_COUNTER
     
     def __TurnOnDisplay(self):
-        self.__SendCommand(0x20)
+        self.__Send(0x20)
         self.__ReadBusy()
     
     def Reset(self):    # Hardware reset
-        self._reset_pin.high()
-        self.__Delayms(50)
+        self._initialized_for = None
+        self._ram_crc = [None, None]
+        self._ram_synced = False
+        if not self._rst_settled:   # RST only has to be held high first the very first time, afterwards it idles high
+            self._reset_pin.high()
+            self.__Delayms(10)
         self._reset_pin.low()
         self.__Delayms(2)
         self._reset_pin.high()
-        self.__Delayms(50) 
+        self.__Delayms(10)
+        self._rst_settled = True
     
     # always call RefreshMode() after changing color mode, even if refresh mode is not changed
     # when switching from '3-color' mode to '2-color' mode, if there's red on the display, set REFRESH = True
+    @micropython.native
     def ColorMode(self, COLORMODE, REFRESH = False):
         if COLORMODE == '3-color':
             self._color_mode = COLORMODE
@@ -204,23 +489,28 @@ class EPD_2in66_B:
         else:
             raise ValueError('\'COLORMODE\' in ColorMode()')
     
-    def RefreshMode(self, REFRESHMODE):
+    # hardware reset + SWRESET, then RAM addressing setup, common to every mode
+    def __HwInit(self):
         self.Reset()
-        self.__SendCommand(0x12)    #SWRESET
+        self.__Send(0x12)    #SWRESET
         self.__ReadBusy()
-        self.__SendCommand(0x11)	#Data Entry mode setting
         if (self._orientation == 'portrait' or self._orientation == 'portrait_flipped'):
-            self.__SendData(0x03)
+            self.__Send(0x11, b'\x03')	#Data Entry mode setting
         else:
-            self.__SendData(0x07)
+            self.__Send(0x11, b'\x07')
         self.__SetWindow()
         self.__SetCursor()
+    
+    # the controller is only re-initialized when color mode or refresh mode actually changed since the last call
+    @micropython.native
+    def RefreshMode(self, REFRESHMODE):
+        if (self._color_mode, REFRESHMODE) == self._initialized_for:
+            return
+        self.__HwInit()
         if self._color_mode == '3-color':
             if REFRESHMODE == 'global':
                 print('Global Refresh')
-                self.__SendCommand(0x21)
-                self.__SendData (0x00)
-                self.__SendData (0x80)
+                self.__Send(0x21, b'\x00\x80')
                 self._refresh_mode = REFRESHMODE
             elif REFRESHMODE == 'partial':
                 raise NotImplementedError('Partial refresh is not implemented for 3-color mode')
@@ -229,45 +519,34 @@ class EPD_2in66_B:
         else:
             if REFRESHMODE == 'global':
                 print('Global Refresh')
-                self.__SendCommand(0x21)
-                self.__SendData(0x40)
-                self.__SendData(0x80)
-                self.__SendCommand(0x3C)
-                self.__SendData(0x01)
+                self.__Send(0x21, b'\x40\x80')
+                self.__Send(0x3C, b'\x01')
                 self._refresh_mode = REFRESHMODE
             elif REFRESHMODE == 'partial':
                 print('Partial Refresh')
                 self.__SendLUT()
-                self.__SendCommand(0x21)	#display update control 1
-                self.__SendData(0x00)
-                self.__SendData(0x80)
-                self.__SendCommand(0x37) # set display option, these setting turn on previous function
-                self.__SendData(0x00)
-                self.__SendData(0x00)
-                self.__SendData(0x00)
-                self.__SendData(0x00)
-                self.__SendData(0x00)  
-                self.__SendData(0x40)
-                self.__SendData(0x00)
-                self.__SendData(0x00)
-                self.__SendData(0x00)
-                self.__SendData(0x00)
-                self.__SendCommand(0x3C)
-                self.__SendData(0x80)
-                self.__SendCommand(0x22)
-                self.__SendData(0xCF)
-                self.__SendCommand(0x20)
+                self.__Send(0x21, b'\x00\x80')	#display update control 1
+                self.__Send(0x37, b'\x00\x00\x00\x00\x00\x40\x00\x00\x00\x00') # set display option, these setting turn on previous function
+                self.__Send(0x3C, b'\x80')
+                self.__Send(0x22, b'\xCF')
+                self.__Send(0x20)
                 self.__ReadBusy()
                 self._refresh_mode = REFRESHMODE
             else:
                 raise ValueError('\'REFRESHMODE\' in RefreshMode()')
+        self._initialized_for = (self._color_mode, self._refresh_mode)
     
     # manual refresh, will display the epd's internal buffer
     # any changes made to the black_buffer/red_buffer after last Draw() command will not be displayed
-    def Refresh(self):
+    # Refresh(DEFER = True): in '2-color' partial mode, instead of re-initializing the display twice right now,
+    # the global refresh is done by the next Draw(), the same way as auto refresh
+    @micropython.native
+    def Refresh(self, DEFER = False):
         print('Refresh')
         if self._refresh_mode == 'global':
             self.Draw()
+        elif DEFER and self._color_mode == '2-color':
+            self._refresh_pending = True
         else:
             self.RefreshMode('global')
             self.Draw()
@@ -279,55 +558,163 @@ class EPD_2in66_B:
         self._ar_enabled = AR
         self._max_pr = MAX_PR
     
+    # True if the next Draw() will do a global refresh, either auto refresh is due or Refresh(DEFER = True) was called
+    # lets the caller batch changes into the slower global refresh
+    def RefreshDue(self):
+        if self._color_mode == '2-color' and self._refresh_mode == 'partial':
+            return self._refresh_pending or (self._ar_enabled and self._pr >= self._max_pr)
+        return False
+    
     # CombineRB(True): in '2-color' mode, content in red buffer will be displayed in black
     # CombineRB(False): in '2-color' mode, content in red buffer will not be displayed
     # has no effect in '3-color' mode
     def CombineRB(self, CRB):
+        if CRB != self._CRB:
+            self._ram_synced = False    # the whole image changes, the next Draw() has to send a whole frame
         self._CRB = CRB
+        self._dirty = None
+    
+    # MarkDirty(X, Y, W, H): only this area of black_buffer/red_buffer was changed since the last Draw()
+    # in '2-color' partial mode, the next Draw() then only sends the RAM window covering the marked areas
+    # several calls before one Draw() are merged into their bounding box, without any call the whole frame is sent
+    # changes outside the marked areas are not displayed until they are marked or a whole frame is sent
+    def MarkDirty(self, X, Y, W, H):
+        x0 = max(X, 0)
+        y0 = max(Y, 0)
+        x1 = min(X + W, self._width)
+        y1 = min(Y + H, self._height)
+        if (x0 >= x1 or y0 >= y1):
+            return
+        d = self._dirty
+        if d is None:
+            d = self._dirty_box
+            d[0] = x0
+            d[1] = y0
+            d[2] = x1
+            d[3] = y1
+            self._dirty = d
+        else:
+            d[0] = min(d[0], x0)
+            d[1] = min(d[1], y0)
+            d[2] = max(d[2], x1)
+            d[3] = max(d[3], y1)
+    
+    # black image for RAM 0x24, with the red image merged in when CombineRB() is on
+    def __BuildBW(self):
+        if self._CRB:
+            return self.__BuildRB()
+        else:
+            return self.__BuildBlack()
+    
+    # True if buf differs from what RAM 0x24 (plane 0) / 0x26 (plane 1) holds
+    # buf is then recorded as the new RAM content, so the caller must send it
+    def __NeedsWrite(self, plane, buf):
+        if crc32 is None:
+            return True
+        crc = crc32(buf)
+        if crc == self._ram_crc[plane]:
+            return False
+        self._ram_crc[plane] = crc
+        return True
     
+    # send only the RAM window covering the dirty area, then restore the full window for the next frame
+    def __SendDirty(self, dirty):
+        w = self._win
+        g = self._gather_g
+        self._window(dirty, w, g)
+        xb0 = w[0]
+        xb1 = w[1]
+        ya = w[2]
+        yb = w[3]
+        tx = self._tx_mv
+        self.__WaitDMA()    # any transfer may be a view of tx (_tx_win), so don't rely on matching the source object
+        if self._CRB:
+            n = _gather(self._black_buffer_array, self._red_buffer_array, tx, g)
+        else:
+            n = _gather(self._black_buffer_array, self._black_buffer_array, tx, g)
+        # __Send() writes synchronously, so the parameter scratch can be refilled right after each call
+        par = self._par
+        par[0] = xb0
+        par[1] = xb1
+        self.__Send(0x44, self._par2)
+        par[0] = ya & 0xFF
+        par[1] = ya >> 8
+        par[2] = yb & 0xFF
+        par[3] = yb >> 8
+        self.__Send(0x45, self._par4)
+        par[0] = xb0
+        self.__Send(0x4E, self._par1)
+        par[0] = ya & 0xFF
+        par[1] = ya >> 8
+        self.__Send(0x4F, self._par2)
+        if n != self._tx_win_len:
+            self._tx_win = tx[:n]
+            self._tx_win_len = n
+        self.__Send(0x24)
+        self.__SendDataBytes(self._tx_win)
+        self.__SetWindow()
+        self.__SetCursor()
+        self._ram_crc[0] = None # RAM 0x24 no longer matches a checksummed frame
+    
+    # an image plane the display RAM already holds is not sent again, the refresh itself always runs
+    @micropython.native
     def Draw(self):
         print('Drawing')
-        if self._color_mode == '3-color':
-            self.__SendCommand(0x24)
-            self.__SendBlack()
-            self.__SendCommand(0x26)
-            self.__SendRed()
+        dirty = self._dirty
+        self._dirty = None
+        if self._color_mode == '2-color' and not self.RefreshDue():
+            # most frequent path, the red image is never reshuffled or sent
+            if (dirty is not None and self._refresh_mode == 'partial' and self._ram_synced):
+                self.__SendDirty(dirty)
+            else:
+                bw = self.__BuildBW()
+                if self.__NeedsWrite(0, bw):
+                    self.__Send(0x24)
+                    self.__SendDataBytes(bw)
+                self._ram_synced = True
             self.__TurnOnDisplay()
-            self._pr = 0
-        else:
-            if self._ar_enabled and self._refresh_mode == 'partial' and self._pr >= self._max_pr:
-                self.ColorMode('3-color')	# refresh using the factory LUT
-                self.RefreshMode('global')
-                self.__SendCommand(0x26)	# manually send red(all 0), so red image is kept in buffer
-                for i in range(0, self._x_byte * self._y_bit):
-                    self.__SendData(0x00)
-                if self._CRB:
-                    self.__SendCommand(0x24)
-                    self.__SendRB()
-                else:
-                    self.__SendCommand(0x24)
-                    self.__SendBlack()
-                self.__TurnOnDisplay()
-                self.ColorMode('2-color')
-                self.RefreshMode('partial')
+            if self._ar_enabled and self._refresh_mode == 'partial':
+                self._pr += 1
+            elif self._refresh_mode == 'global':
+                # a global refresh, also when done by Refresh()/Clear(), covers a deferred or due auto refresh
                 self._pr = 0
+                self._refresh_pending = False
             else:
-                if self._CRB:
-                    self.__SendCommand(0x24)
-                    self.__SendRB()
-                else:
-                    self.__SendCommand(0x24)
-                    self.__SendBlack()
-                self.__TurnOnDisplay()
-                if self._ar_enabled and self._refresh_mode == 'partial':
-                    self._pr += 1
-                else:
-                    self._pr = 0
+                self._pr = 0
+        elif self._color_mode == '3-color':
+            black = self.__BuildBlack()
+            if self.__NeedsWrite(0, black):
+                self.__Send(0x24)
+                self.__SendDataBytes(black)
+            red = self.__BuildTx(self._red_buffer_array, 0xFF, self._tx_red_mv)  # overlaps the black transfer when it is sent by DMA
+            if self.__NeedsWrite(1, red):
+                self.__Send(0x26)
+                self.__SendDataBytes(red)
+            self._ram_synced = True
+            self.__TurnOnDisplay()
+            self._pr = 0
+            self._refresh_pending = False
+        else:
+            self.ColorMode('3-color')	# refresh using the factory LUT
+            self.RefreshMode('global')
+            self.__Send(0x26)	# manually send red(all 0), so red image is kept in buffer
+            _clear(self._tx_red_mv)
+            self.__SendDataBytes(self._tx_red_mv)
+            bw = self.__BuildBW()   # built while the zeros are sent when DMA is used
+            self.__Send(0x24)
+            self.__SendDataBytes(bw)
+            self.__TurnOnDisplay()
+            self.ColorMode('2-color')
+            self.RefreshMode('partial')
+            self._pr = 0
+            self._refresh_pending = False
         print('Drawn')
     
+    @micropython.native
     def Clear(self, MODE = 'global'):
         self.black_buffer.fill(1)
         self.red_buffer.fill(1)
+        self._dirty = None
         print('Clear')
         if MODE == 'global':
             if self._refresh_mode == 'global':
@@ -350,8 +737,8 @@ class EPD_2in66_B:
             raise ValueError('\'MODE\' in Clear()')
     
     def Sleep(self):
-        self.__SendCommand(0x10) # deep sleep
-        self.__SendData(0x01)
+        self.__Send(0x10, b'\x01') # deep sleep
+        self._initialized_for = None    # waking up needs a hardware reset
         print("Sleep")
 
 
@@ -360,8 +747,8 @@ if __name__=='__main__':
     DC = Pin(8, Pin.OUT)
     CS = Pin(9, Pin.OUT)
     BUSY = Pin(6, Pin.IN, Pin.PULL_UP)
-    epd_spi = SPI(1, baudrate = 4000000, polarity = 0, phase = 0, bits = 8, firstbit = SPI.MSB, sck = Pin(10), mosi = Pin(11), miso = Pin(12))
-    epd = EPD_2in66_B(RST, DC, CS, BUSY, epd_spi, 'landscape_flipped')
+    epd_spi = SPI(1, baudrate = 20000000, polarity = 0, phase = 0, bits = 8, firstbit = SPI.MSB, sck = Pin(10), mosi = Pin(11), miso = Pin(12))
+    epd = EPD_2in66_B(RST, DC, CS, BUSY, epd_spi, 'landscape_flipped', SPI_ID = 1)
     
     epd.ColorMode('2-color')
     epd.RefreshMode('partial')
@@ -406,6 +793,7 @@ if __name__=='__main__':
     for i in range(10):
         epd.black_buffer.fill_rect(250, 100, 20, 20, 1)
         epd.black_buffer.text(str(i), 256, 106, 0)
+        epd.MarkDirty(250, 100, 20, 20)
         epd.Draw()
     
     epd.ColorMode('3-color')